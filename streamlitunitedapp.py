@@ -3,14 +3,29 @@
 Streamlit app — Next 10 Manchester United fixtures + estimated win probability
 """
 
+import io
+import math
+import os
+import shelve
+import tempfile
+
 import streamlit as st
 import requests
 from bs4 import BeautifulSoup
+from lxml import etree
+import numpy as np
 import pandas as pd
 import re
 import time
+from collections import namedtuple
 from datetime import datetime
-from difflib import SequenceMatcher
+from functools import lru_cache
+from rapidfuzz import process, fuzz
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the NumPy path below is the fallback
+    njit = None
 
 # 🔑 page config MUST be the first Streamlit command
 st.set_page_config(
@@ -33,25 +48,51 @@ st.markdown(
 ESPN_FIXTURES_URL = "https://www.espn.com/soccer/team/fixtures/_/id/360/manchester-united"
 CLUBELO_ALL_URL = "https://clubelo.com/All"
 CLUBELO_BASE = "https://clubelo.com"
+CLUBELO_API = "http://api.clubelo.com"
 
 HEADERS = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 Chrome/114.0 Safari/537.36"}
 
+# compiled once at import; [a-z0-9] fixes the old [^a-z1-10] char class that dropped digits 2-9
+_NORM_RE = re.compile(r'[^a-z0-9]')
+# non-greedy bridge tolerates markup between the 'Elo' label and the number
+_ELO_RE = re.compile(r'Elo[\s:<>/a-zA-Z"=]*?(\d{3,4})')
+# date lines look like 'Sun, Aug 24' or 'Sat, Oct 4'
+_DATE_RE = re.compile(r'^[A-Za-z]{3,9},\s+[A-Za-z]{3,9}\s+\d{1,2}$')
+_TIME_RE = re.compile(r'\d{1,2}:\d{2}\s*(AM|PM)', re.I)
+_MU_RE = re.compile(r'Manchester United|Man Utd|ManUnited')
+
+@st.cache_resource
+def _session():
+    """Shared pooled requests.Session: keep-alive amortizes the TLS handshake
+       across every scrape instead of reconnecting per call."""
+    s = requests.Session()
+    s.headers.update(HEADERS)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=16)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
 @st.cache_data(ttl=300)
 def fetch_page_text(url):
-    r = requests.get(url, headers=HEADERS, timeout=12)
+    r = _session().get(url, timeout=12)
     r.raise_for_status()
     return r.text
 
+@lru_cache(maxsize=2048)
 def normalize(name: str) -> str:
-    return re.sub(r'[^a-z1-10]', '', name.lower())
+    return _NORM_RE.sub('', name.lower())
 
-@st.cache_data(ttl=24*3600)
+@st.cache_resource(ttl=24*3600)
 def build_clubelo_index():
-    """Return list of (display_name, href, normalized_name) from clubelo All page"""
+    """Return (exact_map, norms) from the clubelo All page:
+       exact_map is {normalized_name: (href, display_name)}, norms a tuple of its keys.
+       cache_resource: callers treat the index as read-only, so skip
+       cache_data's per-access deep copy.
+    """
     txt = fetch_page_text(CLUBELO_ALL_URL)
-    soup = BeautifulSoup(txt, "html.parser")
+    soup = BeautifulSoup(txt, "lxml")
     anchors = soup.find_all("a", href=True)
-    items = []
+    exact_map = {}
     for a in anchors:
         text = a.get_text(strip=True)
         href = a['href']
@@ -59,80 +100,206 @@ def build_clubelo_index():
             continue
         # Many anchors point to country pages etc; filter likely club links (href looks like /ClubName or /SomeName)
         if href.startswith("/") and len(text) > 2 and len(href) < 60:
-            items.append((text, href, normalize(text)))
-    # remove duplicates
-    seen = set()
-    out = []
-    for t,h,n in items:
-        if n not in seen:
-            seen.add(n)
-            out.append((t,h,n))
-    return out
+            # first occurrence wins, matching the old de-dupe order
+            exact_map.setdefault(normalize(text), (href, text))
+    return exact_map, tuple(exact_map)
 
 def find_clubelo_href(team_name: str):
     """Find best ClubElo href for a team name using fuzzy match on the All index.
        Returns (href, display_name) or (None, None).
     """
-    index = build_clubelo_index()
+    exact_map, norms = build_clubelo_index()
     target = normalize(team_name)
-    best = (None, None, 0.0)
-    for display, href, norm in index:
-        # exact match
-        if norm == target:
-            return href, display
-        # substring match
+    # exact match: O(1) dict hit, no scan
+    hit = exact_map.get(target)
+    if hit:
+        return hit
+    # substring match (miss path only)
+    for norm in norms:
         if target in norm or norm in target:
-            return href, display
-        # fuzzy
-        ratio = SequenceMatcher(None, norm, target).ratio()
-        if ratio > best[2]:
-            best = (href, display, ratio)
-    # accept if ratio >= 0.65 else fail
-    if best[2] >= 0.65:
-        return best[0], best[1]
+            return exact_map[norm]
+    # fuzzy: single C-level pass over all normalized names (RapidFuzz)
+    match = process.extractOne(target, norms, scorer=fuzz.WRatio, score_cutoff=65)
+    if match:
+        return exact_map[match[0]]
     return None, None
 
+# on-disk Elo cache: survives process restarts, unlike st.cache_data
+_DISK_CACHE_PATH = os.path.join(tempfile.gettempdir(), "clubelo_cache")
+_DISK_CACHE_TTL = 24 * 3600
+
+def _disk_cache_get(norm_name):
+    try:
+        with shelve.open(_DISK_CACHE_PATH) as db:
+            elo, ts = db[norm_name]
+        if time.time() - ts < _DISK_CACHE_TTL:
+            return elo
+    except Exception:
+        pass
+    return None
+
+def _disk_cache_set(norm_name, elo):
+    try:
+        with shelve.open(_DISK_CACHE_PATH) as db:
+            db[norm_name] = (elo, time.time())
+    except Exception:
+        pass
+
+@st.cache_resource(ttl=24*3600)
+def build_clubelo_elos():
+    """Return {normalized_club_name: elo} from the ClubElo CSV API.
+       One dated request covers every club — a few hundred bytes, no HTML.
+       Read-only reference data, so cache_resource (no per-access copy).
+    """
+    txt = fetch_page_text(f"{CLUBELO_API}/{datetime.utcnow():%Y-%m-%d}")
+    df = pd.read_csv(io.StringIO(txt))
+    return {normalize(club): int(elo) for club, elo in zip(df["Club"], df["Elo"])}
+
 @st.cache_data(ttl=24*3600)
 def get_elo_for_team(team_name: str, default=1500):
     """Attempt to fetch Elo rating for a team from clubelo.
        Falls back to default if not found.
     """
+    norm = normalize(team_name)
+    cached = _disk_cache_get(norm)
+    if cached is not None:
+        return cached
+    try:
+        elo = build_clubelo_elos().get(norm)
+        if elo is not None:
+            _disk_cache_set(norm, elo)
+            return elo
+    except Exception:
+        pass
+    # fallback: scrape the club's own page (covers names the CSV spells differently)
     try:
         href, display = find_clubelo_href(team_name)
         if not href:
             return default
         url = CLUBELO_BASE + href
         html = fetch_page_text(url)
-        m = re.search(r'Elo[:\s]*([1-10]{3,4})', html)
+        m = _ELO_RE.search(html)
         if m:
-            return int(m.group(1))
-        # fallback: look for 'Elo' label in text
-        text = BeautifulSoup(html, "html.parser").get_text(" ")
-        m2 = re.search(r'Elo[:\s]*([1-10]{3,4})', text)
-        if m2:
-            return int(m2.group(1))
+            elo = int(m.group(1))
+            _disk_cache_set(norm, elo)
+            return elo
     except Exception:
         pass
     return default
 
-def parse_espn_fixtures_page(limit=20):
-    """Scrape ESPN fixtures page text and extract upcoming matches that contain 'Manchester United'.
-       Returns list of dicts: {date_text, opponent, home (True/False), competition, time_text}
+@st.cache_resource(ttl=24*3600)
+def _manu_elo():
+    """Man Utd's own Elo, resolved once per day; conservative default on failure."""
+    try:
+        return get_elo_for_team("Man United", default=1700)
+    except Exception:
+        return 1700
+
+def lookup_opponent_elo(team_name: str, default=1500):
+    """Resolve an opponent's Elo from the prebuilt CSV map: exact normalized
+       hit first, then a RapidFuzz pass over the map keys, then the per-club
+       page scrape as a last resort.
     """
-    html = fetch_page_text(ESPN_FIXTURES_URL)
-    soup = BeautifulSoup(html, "html.parser")
-    # Work with the soup text lines, they tend to contain 'v' between teams
+    try:
+        elos = build_clubelo_elos()
+    except Exception:
+        elos = {}
+    if elos:
+        target = normalize(team_name)
+        elo = elos.get(target)
+        if elo is not None:
+            return elo
+        match = process.extractOne(target, tuple(elos), scorer=fuzz.WRatio, score_cutoff=65)
+        if match:
+            return elos[match[0]]
+    return get_elo_for_team(team_name, default=default)
+
+# lightweight fixture record: cheaper than a 5-key dict per parsed row
+Fixture = namedtuple("Fixture", "date_text time_text competition opponent home")
+
+def _man_utd_opponent(team_a, team_b):
+    """Return (opponent, home) if Man Utd is one of the two teams, else None."""
+    if _MU_RE.search(team_a):
+        return team_b, True
+    if _MU_RE.search(team_b):
+        return team_a, False
+    return None
+
+def _fixture_from_row(date_text, teams, cells):
+    """Build a Fixture from one table row's team names and cell texts.
+       Returns None when the row isn't a Man Utd fixture."""
+    if len(teams) < 2:
+        return None
+    found = _man_utd_opponent(teams[0], teams[1])
+    if not found:
+        return None
+    opponent, home = found
+    time_text = ""
+    comp_text = ""
+    for c in cells[2:]:
+        m = _TIME_RE.search(c)
+        if m and not time_text:
+            time_text = m.group(0)
+            comp_text = comp_text or c.replace(time_text, "").strip()
+        elif c and not comp_text:
+            comp_text = c
+    return Fixture(date_text, time_text, comp_text, opponent, home)
+
+def _fixtures_from_stream():
+    """Stream the ESPN page through lxml.etree.iterparse, handling one <tr>
+       at a time and freeing it immediately — peak memory stays flat instead
+       of holding the full ~500KB page plus a DOM.
+    """
+    r = _session().get(ESPN_FIXTURES_URL, stream=True, timeout=12)
+    r.raise_for_status()
+    r.raw.decode_content = True
+    fixtures = []
+    date_text = ""
+    for _event, elem in etree.iterparse(r.raw, events=("end",), tag=("div", "tr"), html=True):
+        if elem.tag == "div":
+            # the Table__Title div carries the date for the rows that follow
+            if "Table__Title" in (elem.get("class") or ""):
+                date_text = " ".join("".join(elem.itertext()).split())
+        else:
+            cells = [" ".join("".join(td.itertext()).split()) for td in elem.iter("td")]
+            teams = [t for t in (" ".join("".join(a.itertext()).split()) for a in elem.iter("a"))
+                     if t and t.lower() not in ("v", "vs")]
+            fixture = _fixture_from_row(date_text, teams, cells)
+            if fixture:
+                fixtures.append(fixture)
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+    return fixtures
+
+def _fixtures_from_tables(soup):
+    """Parse ESPN's fixture tables straight from the DOM (one table per date).
+       Returns [] if the expected markup isn't there, so the caller can fall
+       back to the text heuristic.
+    """
+    fixtures = []
+    for table_div in soup.select("div.ResponsiveTable"):
+        title = table_div.find(class_="Table__Title")
+        date_text = title.get_text(strip=True) if title else ""
+        for tr in table_div.select("tbody tr"):
+            cells = [td.get_text(" ", strip=True) for td in tr.find_all("td")]
+            teams = [t for t in (a.get_text(strip=True) for a in tr.find_all("a"))
+                     if t and t.lower() not in ("v", "vs")]
+            fixture = _fixture_from_row(date_text, teams, cells)
+            if fixture:
+                fixtures.append(fixture)
+    return fixtures
+
+def _fixtures_from_text(soup):
+    """Older fallback: scan the page text for 'v' separator lines."""
     text = soup.get_text("\n")
     lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
     fixtures = []
     current_date = None
-    # date lines look like 'Sun, Aug 24' or 'Sat, Oct 4'
-    date_re = re.compile(r'^[A-Za-z]{3,9},\s+[A-Za-z]{3,9}\s+\d{1,2}$')
-    time_re = re.compile(r'\d{1,2}:\d{2}\s*(AM|PM)', re.I)
     i = 1
     while i < len(lines):
         ln = lines[i]
-        if date_re.match(ln):
+        if _DATE_RE.match(ln):
             current_date = ln
             i += 1
             continue
@@ -155,38 +322,42 @@ def parse_espn_fixtures_page(limit=20):
                         tail.append(lines[j+k])
                 # find first time-like string in tail
                 for t in tail:
-                    if time_re.search(t):
-                        time_text = time_re.search(t).group(0)
+                    if _TIME_RE.search(t):
+                        time_text = _TIME_RE.search(t).group(0)
                         # competition often at same line after time (e.g. "11:30 AM English Premier League")
                         comp = t.replace(time_text, "").strip()
                         comp_text = comp
                         break
                 # Determine whether Man Utd involved
-                for_man = None
-                if 'Manchester United' in team_a or 'Man Utd' in team_a or 'ManUnited' in team_a:
-                    home = True
-                    opponent = team_b
-                    for_man = True
-                elif 'Manchester United' in team_b or 'Man Utd' in team_b or 'ManUnited' in team_b:
-                    home = False
-                    opponent = team_a
-                    for_man = True
-                if for_man:
-                    fixtures.append({
-                        "date_text": current_date or "",
-                        "time_text": time_text,
-                        "competition": comp_text,
-                        "opponent": opponent,
-                        "home": home
-                    })
+                found = _man_utd_opponent(team_a, team_b)
+                if found:
+                    opponent, home = found
+                    fixtures.append(Fixture(current_date or "", time_text, comp_text, opponent, home))
             i += 1
             continue
         i += 1
+    return fixtures
+
+@st.cache_data(ttl=300)
+def parse_espn_fixtures_page(limit=20):
+    """Scrape ESPN fixtures page and extract upcoming matches that contain 'Manchester United'.
+       Streams the fixture tables with iterparse; falls back to a full soup
+       parse and then the line-scan heuristic if ESPN's markup changes.
+       Returns a list of Fixture tuples.
+    """
+    try:
+        fixtures = _fixtures_from_stream()
+    except Exception:
+        fixtures = []
+    if not fixtures:
+        html = fetch_page_text(ESPN_FIXTURES_URL)
+        soup = BeautifulSoup(html, "lxml")
+        fixtures = _fixtures_from_tables(soup) or _fixtures_from_text(soup)
     # remove duplicates and keep order
     seen = set()
     out = []
     for f in fixtures:
-        key = (f['date_text'], f['opponent'], f['home'])
+        key = (f.date_text, f.opponent, f.home)
         if key not in seen:
             seen.add(key)
             out.append(f)
@@ -194,32 +365,60 @@ def parse_espn_fixtures_page(limit=20):
             break
     return out
 
+# 10 ** (x/400) == exp(x * ln10/400); exp is the cheaper libm call
+_ALPHA = math.log(10) / 400.0
+
 def elo_expected(a, b):
     """Elo expected score for A vs B"""
-    return 1.0 / (1.0 + 10 ** ((b - a) / 400.0))
+    return 1.0 / (1.0 + math.exp(_ALPHA * (b - a)))
 
-def probability_from_elos(elo_a, elo_b, man_is_home):
-    """Return (p_win_man, p_draw, p_loss) using an Elo-based conversion with home adv and draw baseline"""
+def _probs_numpy(man_elo, opp_elos, home_mask):
     HOME_ADV = 100  # Elo points added to home team
-    ra = elo_a
-    rb = elo_b
-    if man_is_home:
-        ra += HOME_ADV
-    else:
-        rb += HOME_ADV
+    ra = man_elo + np.where(home_mask, HOME_ADV, 0)
+    rb = opp_elos + np.where(home_mask, 0, HOME_ADV)
     p_draw_base = 0.23  # baseline draw probability from historical EPL ~23%. :contentReference[oaicite:5]{index=5}
     # reduce draw chance when Elo gap is large:
-    gap = abs(ra - rb)
-    draw_prob = max(0.10, p_draw_base - (gap / 2000.0))  # simple heuristic
-    p_expected = elo_expected(ra, rb)  # probability ManU would "win or get full points" in BT sense
+    gap = np.abs(ra - rb)
+    draw_prob = np.maximum(0.10, p_draw_base - gap / 2000.0)  # simple heuristic
+    p_expected = 1.0 / (1.0 + np.exp(_ALPHA * (rb - ra)))  # probability ManU would "win or get full points" in BT sense
     p_win = (1 - draw_prob) * p_expected
-    p_loss = (1 - draw_prob) * (1 - p_expected)
-    # correct tiny rounding errors
-    rem = 1.0 - (p_win + draw_prob + p_loss)
-    if abs(rem) > 1e-6:
-        p_loss += rem
+    p_loss = 1.0 - p_win - draw_prob
     return p_win, draw_prob, p_loss
 
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _probs_numba(man_elo, opp_elos, home_mask):
+        # same model as _probs_numpy, as one fused loop with no temporaries
+        n = opp_elos.shape[0]
+        p_win = np.empty(n)
+        p_draw = np.empty(n)
+        p_loss = np.empty(n)
+        for i in range(n):
+            ra = man_elo
+            rb = opp_elos[i]
+            if home_mask[i]:
+                ra += 100.0
+            else:
+                rb += 100.0
+            gap = abs(ra - rb)
+            draw = 0.23 - gap / 2000.0
+            if draw < 0.10:
+                draw = 0.10
+            p_expected = 1.0 / (1.0 + math.exp(_ALPHA * (rb - ra)))
+            p_win[i] = (1.0 - draw) * p_expected
+            p_draw[i] = draw
+            p_loss[i] = 1.0 - p_win[i] - draw
+        return p_win, p_draw, p_loss
+
+def probabilities_from_elos(man_elo, opp_elos, home_mask):
+    """Return (p_win, p_draw, p_loss) arrays for Man Utd over a whole fixture batch,
+       using an Elo-based conversion with home adv and draw baseline.
+    """
+    if njit is not None:
+        return _probs_numba(float(man_elo), np.asarray(opp_elos, dtype=np.float64),
+                            np.asarray(home_mask, dtype=np.bool_))
+    return _probs_numpy(man_elo, opp_elos, home_mask)
+
 # ---------------- Streamlit UI ----------------
 st.title("United fixtures app")
 
@@ -253,43 +452,43 @@ with st.spinner("Fetching fixtures from ESPN..."):
 if not raw_fixtures:
     st.warning("No fixtures found on ESPN page. You can still enter manual fixtures in the table below.")
 # prepare table rows
+TABLE_COLS = ["Date", "Opponent", "Home?", "ManU Elo (est.)", "Opp Elo (est.)",
+              "P(Win %)", "P(Draw %)", "P(Loss %)"]
 rows = []
-man_elo_cached = None
-for f in raw_fixtures[:n]:
-    opponent = f['opponent']
-    home = f['home']
-    date_text = f['date_text']
-    time_text = f['time_text']
-    comp = f['competition']
-    # get elos
-    try:
-        if man_elo_cached is None:
-            man_elo_cached = get_elo_for_team("Man United", default=1700)  # fallback default
-        opp_elo = get_elo_for_team(opponent, default=1500)
-    except Exception:
-        man_elo_cached = 1700
-        opp_elo = 1500
-    p_win, p_draw, p_loss = probability_from_elos(man_elo_cached, opp_elo, man_is_home=home)
-    rows.append({
-        "Date": date_text + ((" " + time_text) if time_text else ""),
-        "Opponent": opponent,
-        "Home?": "Home" if home else "Away",
-        "ManU Elo (est.)": man_elo_cached,
-        "Opp Elo (est.)": opp_elo,
-        "P(Win %)": round(p_win * 100, 1),
-        "P(Draw %)": round(p_draw * 100, 1),
-        "P(Loss %)": round(p_loss * 100, 1),
-    })
+shown_fixtures = raw_fixtures[:n]
+# resolve opponent Elos from the prebuilt map — dict hits, no network per fixture
+opponents = {f.opponent for f in shown_fixtures}
+opp_elos = {name: lookup_opponent_elo(name, default=1500) for name in opponents}
+man_elo_cached = _manu_elo()
+if shown_fixtures:
+    # one vectorized pass over the whole batch instead of per-fixture scalar math
+    opp_elo_arr = np.array([opp_elos.get(f.opponent, 1500) for f in shown_fixtures], dtype=np.float64)
+    home_mask = np.array([f.home for f in shown_fixtures], dtype=bool)
+    p_wins, p_draws, p_losses = probabilities_from_elos(man_elo_cached, opp_elo_arr, home_mask)
+    for f, opp_elo, p_win, p_draw, p_loss in zip(shown_fixtures, opp_elo_arr, p_wins, p_draws, p_losses):
+        rows.append((
+            f.date_text + ((" " + f.time_text) if f.time_text else ""),
+            f.opponent,
+            "Home" if f.home else "Away",
+            man_elo_cached,
+            int(opp_elo),
+            round(p_win * 100, 1),
+            round(p_draw * 100, 1),
+            round(p_loss * 100, 1),
+        ))
 
 if rows:
-    df = pd.DataFrame(rows)
-    df.index = df.index + 1   # 👈 this makes the index start at 1
-    st.dataframe(df, use_container_width=True)
+    # st.table renders list-of-dicts directly — no DataFrame build or Arrow
+    # round trip for a handful of rows
+    st.table([dict(zip(TABLE_COLS, row)) for row in rows])
 
     # show bars
     st.markdown("### Win probabilities visual")
-    prob_df = df[["Opponent", "P(Win %)"]].set_index("Opponent")
-    st.bar_chart(prob_df)
+    win_series = pd.Series([row[5] for row in rows],                 # P(Win %)
+                           index=[row[1] for row in rows],           # Opponent
+                           name="P(Win %)")
+    win_series.index.name = "Opponent"
+    st.bar_chart(win_series)
 
     st.markdown(
         "Model notes:\n"